@@ -1,43 +1,196 @@
+import httpx
 import openai
 import json
 import os
-from typing import Dict
-import streamlit as st
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from . import prompt_cache
+
+# One pooled HTTP/2 transport shared by every agent in the process, so keep-alive
+# connections (and their TLS sessions) survive across interviews and reruns
+_HTTP_TIMEOUT = httpx.Timeout(15.0, connect=3.0)
+_SHARED_HTTP = openai.DefaultHttpxClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    timeout=_HTTP_TIMEOUT
+)
+
+# Retry transient provider errors before falling back to canned questions/evaluations
+_api_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(min=0.5, max=8),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APITimeoutError)),
+    reraise=True
+)
+
+# Structured output schema for per-turn evaluations
+EVAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "feedback": {"type": "string"},
+        "strengths": {"type": "string"},
+        "areas_to_probe": {"type": "string"}
+    },
+    "required": ["score", "feedback", "strengths", "areas_to_probe"],
+    "additionalProperties": False
+}
+
+# Schema for scoring a whole transcript in one request
+TRANSCRIPT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "evaluations": {"type": "array", "items": EVAL_SCHEMA}
+    },
+    "required": ["evaluations"],
+    "additionalProperties": False
+}
 
 class InterviewAgent:
+    _DURATION_MAP = {
+        "Quick (5-8 questions)": 8,
+        "Standard (8-12 questions)": 12,
+        "Comprehensive (12-15 questions)": 15
+    }
+
     def __init__(self, job_config: Dict):
         """Initialize the Interview Agent with job configuration"""
-        self.job_config = job_config
+        self._setup(job_config, self._create_client())
+
+        # Generate first question
+        self.current_question = self._generate_first_question()
+
+    @classmethod
+    def bulk_start(cls, job_config: Dict, candidate_names: List[str]) -> List["InterviewAgent"]:
+        """Start one agent per candidate, generating all opening questions in a single request"""
+        client = cls._create_client()
+        agents = []
+        for name in candidate_names:
+            agent = cls.__new__(cls)
+            agent._setup({**job_config, "candidate_name": name}, client)
+            agents.append(agent)
+
+        request = """
+Candidate: {candidate_name}
+Generate a professional opening question suitable for this position.
+Return only the question text.
+"""
+        try:
+            # The Responses API has no n parameter, so this batch uses chat completions
+            response = _api_retry(client.chat.completions.create)(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": agents[0]._opening_prefix},
+                    {"role": "user", "content": request}
+                ],
+                n=len(candidate_names),
+                temperature=0.9,
+                max_tokens=200
+            )
+            for agent, choice in zip(agents, response.choices):
+                question = choice.message.content.strip()
+                agent.current_question = question.replace("{candidate_name}", agent.job_config["candidate_name"])
+        except Exception:
+            pass
 
+        # No stored responses to chain from; each agent's first turn starts statelessly
+        for agent in agents:
+            if not agent.current_question:
+                agent.current_question = agent._fallback_first_question()
+        return agents
+
+    @classmethod
+    def resume(cls, job_config: Dict, first_question: str, history: List) -> "InterviewAgent":
+        """Rebuild an agent from persisted exchanges (candidate/interviewer/evaluation) without calling the API"""
+        agent = cls.__new__(cls)
+        agent._setup(job_config, cls._create_client())
+        agent.current_question = first_question
+        for exchange in history:
+            agent._record_turn(exchange.candidate, exchange.evaluation, exchange.interviewer)
+        # No stored chains survive a restart; the next turn starts statelessly
+        return agent
+
+    @staticmethod
+    def _create_client() -> openai.OpenAI:
+        """Create an OpenAI client using the configured API key"""
         # Get OpenAI API key from environment or Streamlit secrets
-        api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            # Streamlit is only imported when needed so non-UI callers skip its import cost
+            try:
+                import streamlit as st
+                api_key = st.secrets.get("OPENAI_API_KEY")
+            except (ImportError, FileNotFoundError):
+                api_key = None
         if not api_key:
-            raise openai.error.OpenAIError(
+            raise openai.OpenAIError(
                 "OpenAI API key not found! Set it in environment variables or Streamlit secrets."
             )
+        # Retries are handled by _api_retry; the timeout bounds tail latency per attempt
+        return openai.OpenAI(api_key=api_key, http_client=_SHARED_HTTP, timeout=_HTTP_TIMEOUT, max_retries=0)
 
-        # Initialize OpenAI client
-        self.client = openai.OpenAI(api_key=api_key)
+    def _setup(self, job_config: Dict, client: openai.OpenAI):
+        """Set up configuration and interview state without calling the API"""
+        self.job_config = job_config
+        self.client = client
 
         # Interview state
         self.question_count = 0
         self.current_question = ""
         self.interview_context = []
 
+        # Only the most recent turns are kept verbatim; older ones are folded into a summary.
+        # The stored chains are restarted every window, so the model never sees more than
+        # one window of turns plus the summary and recent topics
+        self._window_size = 5
+        self._summary = ""
+        self._recent_topics = deque(maxlen=self._window_size)
+
+        # Server-side conversation chains (Responses API) for questions and evaluations
+        self._last_resp_id_question = None
+        self._last_resp_id_eval = None
+        # Ids produced during a turn, committed to the chains only once the turn is recorded
+        self._pending_question_id = None
+        self._pending_eval_id = None
+        self.last_turn = {}
+
         # Interview settings based on duration
         self.max_questions = self._get_max_questions()
+        self._progress_percentage = 0.0
 
-        # Generate first question
-        self.current_question = self._generate_first_question()
+        # Truncate the job description once; long postings would otherwise blow the token budget
+        description = job_config.get('description') or ''
+        self._desc_short = description[:800]
+        self._desc_full = description[:3000]
+
+        # Static prompt prefixes, sent byte-identical on every call so provider prompt caching can hit.
+        # Only the one-off opening question gets the full description; follow-ups use the short one
+        interviewer_line = f"You are an experienced interviewer for a {job_config['title']} position."
+        self._opening_prefix = self._build_prefix(interviewer_line, self._desc_full)
+        self._question_prefix = self._build_prefix(interviewer_line, self._desc_short)
+        self._eval_prefix = self._build_prefix(
+            f"You are evaluating candidates for a {job_config['title']} position.",
+            self._desc_short
+        )
+
+    def _build_prefix(self, role_line: str, description: str) -> str:
+        """Build the immutable job-context prefix shared by every call of one kind"""
+        return f"""
+{role_line}
+Experience Level: {self.job_config.get('level', 'Not specified')}
+Interview Type: {self.job_config.get('type', 'Technical')}
+Job Description:
+{description}
+--- END OF JOB CONTEXT ---
+"""
 
     def _get_max_questions(self) -> int:
         """Determine max questions based on duration setting"""
-        duration_map = {
-            "Quick (5-8 questions)": 8,
-            "Standard (8-12 questions)": 12,
-            "Comprehensive (12-15 questions)": 15
-        }
-        return duration_map.get(self.job_config.get("duration", "Standard (8-12 questions)"), 10)
+        return self._DURATION_MAP.get(self.job_config.get("duration", "Standard (8-12 questions)"), 10)
 
     def get_first_question(self) -> str:
         """Return the first question"""
@@ -45,137 +198,287 @@ class InterviewAgent:
 
     def _generate_first_question(self) -> str:
         """Generate opening question"""
-        system_prompt = f"""
-You are an experienced interviewer for a {self.job_config['title']} position.
-Job Description:
-{self.job_config['description']}
+        request = f"""
 Candidate: {self.job_config.get('candidate_name', 'Candidate')}
 Generate a professional opening question suitable for this position.
 Return only the question text.
 """
+        cache_key = prompt_cache.make_key(self._opening_prefix + request, "gpt-4o-mini", 0.7)
+        cached = prompt_cache.get(cache_key)
+        if cached:
+            # No stored response to chain from; later turns start statelessly
+            return cached
+
         try:
-            response = self.client.chat.completions.create(
+            response = self._create_response(
                 model="gpt-4o-mini",
-                messages=[{"role": "system", "content": system_prompt}],
+                instructions=self._opening_prefix,
+                input=[{"role": "user", "content": request}],
                 temperature=0.7,
-                max_tokens=200
+                max_output_tokens=200,
+                store=True
             )
-            return response.choices[0].message['content'].strip()
+            # The question chain continues from here; the eval chain starts with its first call
+            self._last_resp_id_question = response.id
+            question = response.output_text.strip()
+            prompt_cache.put(cache_key, question)
+            return question
         except Exception:
-            # Fallback question
-            return f"Hello! I'm excited to interview you for the {self.job_config['title']} position. Can you start by telling me about your relevant experience and what interests you about this role?"
+            return self._fallback_first_question()
+
+    def _fallback_first_question(self) -> str:
+        """Generic opening question used when generation fails"""
+        return f"Hello! I'm excited to interview you for the {self.job_config['title']} position. Can you start by telling me about your relevant experience and what interests you about this role?"
+
+    @_api_retry
+    def _create_response(self, **params):
+        """Create a Responses API call, retrying rate limits and timeouts"""
+        return self.client.responses.create(**params)
+
+    def _create_chained_response(self, chain: str, system_prompt: str, delta: str, context: str = "", **params):
+        """Send only the new turn on a stored chain, or the full prompt if the chain is unavailable"""
+        # Instructions don't carry over through previous_response_id, so they go on every call
+        previous_id = getattr(self, chain)
+        response = None
+        if previous_id:
+            try:
+                response = self._create_response(
+                    model="gpt-4o-mini",
+                    instructions=system_prompt,
+                    input=[{"role": "user", "content": delta}],
+                    previous_response_id=previous_id,
+                    truncation="auto",
+                    store=True,
+                    **params
+                )
+            except (openai.NotFoundError, openai.BadRequestError):
+                # Stored response expired or was rejected; fall back to the stateless path
+                response = None
+
+        if response is None:
+            response = self._create_response(
+                model="gpt-4o-mini",
+                instructions=system_prompt,
+                input=[{"role": "user", "content": context + delta}],
+                store=True,
+                **params
+            )
+        return response
 
     def process_response(self, candidate_response: str) -> Dict:
         """Process candidate response and generate next question"""
-        evaluation = self._evaluate_response(candidate_response)
+        for _ in self.stream_response(candidate_response):
+            pass
+        return self.last_turn
+
+    def stream_response(self, candidate_response: str) -> Iterator[str]:
+        """Yield the next question as it is generated; the turn result is left in last_turn"""
+        # The next question only needs score/areas_to_probe, so seed it with the
+        # previous turn's evaluation and evaluate the current answer concurrently.
+        prior_eval_hint = self._prior_evaluation_hint()
+        self._pending_question_id = None
+        self._pending_eval_id = None
+
+        # With live evaluation off, answers are scored together by evaluate_transcript
+        live_evaluation = self.job_config.get("live_evaluation", True)
+
+        chunks = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            evaluation_future = executor.submit(self._evaluate_response, candidate_response) if live_evaluation else None
+            for chunk in self._generate_next_question_stream(candidate_response, prior_eval_hint):
+                chunks.append(chunk)
+                yield chunk
+            evaluation = evaluation_future.result() if evaluation_future else {}
+        next_question = "".join(chunks).strip()
+        self._record_turn(candidate_response, evaluation, next_question)
+        self._advance_chains()
+
+        is_final = self.question_count >= self.max_questions
 
-        # Update interview context
+        self.last_turn = {
+            "question": next_question,
+            "evaluation": evaluation,
+            "is_final": is_final,
+            "question_number": self.question_count + 1
+        }
+
+    def _record_turn(self, candidate_response: str, evaluation: Dict, next_question: str):
+        """Update interview context and advance to the next question"""
         self.interview_context.append({
             "question": self.current_question,
             "response": candidate_response,
             "evaluation": evaluation
         })
+        if len(self.interview_context) > self._window_size:
+            self._fold_into_summary(self.interview_context.pop(0))
+        self._recent_topics.append(self.current_question[:100])
 
-        # Generate next question
-        next_question = self._generate_next_question(candidate_response, evaluation)
         self.current_question = next_question
         self.question_count += 1
+        self._progress_percentage = min((self.question_count / self.max_questions) * 100, 100)
 
-        is_final = self.question_count >= self.max_questions
+    def _advance_chains(self):
+        """Move the stored chains onto this turn's responses, once the turn has been recorded"""
+        if self.question_count % self._window_size == 0:
+            # Drop both chains; the next call rebuilds from the summary and recent topics
+            self._last_resp_id_question = None
+            self._last_resp_id_eval = None
+            return
+        if self._pending_question_id:
+            self._last_resp_id_question = self._pending_question_id
+        if self._pending_eval_id:
+            self._last_resp_id_eval = self._pending_eval_id
 
-        return {
-            "question": next_question,
-            "evaluation": evaluation,
-            "is_final": is_final,
-            "question_number": self.question_count + 1
-        }
+    def _fold_into_summary(self, ctx: Dict):
+        """Compress an evicted turn into the running summary of earlier topics"""
+        score = ctx["evaluation"].get("score", "?")
+        self._summary += f"{ctx['question'][:100]} (score {score}); "
+
+    def _prior_evaluation_hint(self) -> Dict:
+        """Return the last stored evaluation, used to steer the next question"""
+        if self.interview_context:
+            return self.interview_context[-1]["evaluation"]
+        return {}
 
-    def _evaluate_response(self, response_text: str) -> str:
+    def _evaluate_response(self, response_text: str) -> Dict:
         """Evaluate candidate response"""
         evaluation_prompt = f"""
 Evaluate this response for a {self.job_config['title']} candidate.
 Question: "{self.current_question}"
 Response: "{response_text}"
-Provide JSON: {{
-  "score": [1-10],
-  "feedback": "[brief constructive feedback]",
-  "strengths": "[key strengths]",
-  "areas_to_probe": "[areas needing more exploration]"
-}}
-Return ONLY JSON.
+Give a score from 1-10, brief constructive feedback, key strengths
+and areas needing more exploration. Keep each text field to one sentence.
 """
+        # Deterministic scoring so identical answers hit the cache
+        cache_key = prompt_cache.make_key(self._eval_prefix + evaluation_prompt, "gpt-4o-mini", 0)
+        cached = prompt_cache.get(cache_key)
+        if cached:
+            return json.loads(cached)
+
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": evaluation_prompt}],
-                temperature=0.7,
-                max_tokens=300
+            response = self._create_chained_response(
+                "_last_resp_id_eval",
+                self._eval_prefix,
+                evaluation_prompt,
+                temperature=0,
+                max_output_tokens=120,
+                text={"format": {"type": "json_schema", "name": "eval", "schema": EVAL_SCHEMA, "strict": True}}
             )
-            eval_text = response.choices[0].message['content'].strip()
-            json.loads(eval_text)  # Ensure valid JSON
-            return eval_text
-        except Exception:
-            # Fallback evaluation
-            return json.dumps({
-                "score": 6,
-                "feedback": "Response received. Let's continue with the next question.",
-                "strengths": "Engagement",
-                "areas_to_probe": "More technical depth"
-            })
-
-    def _generate_next_question(self, candidate_response: str, evaluation: str) -> str:
-        """Generate the next question based on previous response"""
+            eval_text = response.output_text.strip()
+            evaluation = json.loads(eval_text)
+            self._pending_eval_id = response.id
+            prompt_cache.put(cache_key, eval_text)
+            return evaluation
+        except (openai.OpenAIError, ValueError):
+            # Fallback evaluation; ValueError covers output cut off by the token cap
+            return self._fallback_evaluation()
+
+    def evaluate_transcript(self, qa_pairs: List[Tuple[str, str]]) -> List[Dict]:
+        """Score every (question, answer) pair of the interview in a single request"""
+        transcript = "\n".join(
+            f'Answer {i}:\nQuestion: "{question}"\nResponse: "{answer}"\n'
+            for i, (question, answer) in enumerate(qa_pairs, 1)
+        )
+        evaluation_prompt = f"""
+Evaluate each response below for a {self.job_config['title']} candidate, in order.
+For every answer give a score from 1-10, brief constructive feedback, key strengths
+and areas needing more exploration. Keep each text field to one sentence.
+
+{transcript}
+"""
+        evaluations = []
         try:
-            eval_data = json.loads(evaluation)
-            areas_to_probe = eval_data.get("areas_to_probe", "")
-            score = eval_data.get("score", 5)
-        except Exception:
-            areas_to_probe = ""
-            score = 5
+            response = self._create_response(
+                model="gpt-4o-mini",
+                input=[
+                    {"role": "system", "content": self._eval_prefix},
+                    {"role": "user", "content": evaluation_prompt}
+                ],
+                temperature=0,
+                max_output_tokens=120 * len(qa_pairs),
+                text={"format": {"type": "json_schema", "name": "transcript_eval", "schema": TRANSCRIPT_SCHEMA, "strict": True}}
+            )
+            evaluations = json.loads(response.output_text)["evaluations"]
+        except (openai.OpenAIError, ValueError):
+            pass
 
-        # Build context from previous questions
-        context_summary = ""
-        if self.interview_context:
-            recent_topics = [ctx["question"][:100] for ctx in self.interview_context[-3:]]
-            context_summary = f"Previous topics: {'; '.join(recent_topics)}"
+        # Pad with fallbacks if the request failed or returned too few items
+        return [
+            evaluations[i] if i < len(evaluations) else self._fallback_evaluation()
+            for i in range(len(qa_pairs))
+        ]
+
+    @staticmethod
+    def _fallback_evaluation() -> Dict:
+        """Canned evaluation used when scoring fails"""
+        return {
+            "score": 6,
+            "feedback": "Response received. Let's continue with the next question.",
+            "strengths": "Engagement",
+            "areas_to_probe": "More technical depth"
+        }
+
+    def _generate_next_question_stream(self, candidate_response: str, prior_evaluation: Dict) -> Iterator[str]:
+        """Stream the next question based on previous response"""
+        # The current answer is scored concurrently, so this is the previous answer's
+        # evaluation; without one (first turn, or live scoring off) the lines are left out
+        evaluation_lines = ""
+        if prior_evaluation:
+            evaluation_lines = (
+                f"Previous answer's evaluation score: {prior_evaluation.get('score', 'N/A')}\n"
+                f"Areas to probe from the previous answer: {prior_evaluation.get('areas_to_probe', '')}\n"
+            )
+
+        # Build context from previous questions; only needed when the chain has to be rebuilt
+        context_summary = f"Earlier topics: {self._summary}\n" if self._summary else ""
+        if self._recent_topics:
+            context_summary += "Previous topics: " + "; ".join(self._recent_topics) + "\n"
 
         question_prompt = f"""
-You are conducting an interview for {self.job_config['title']}.
-Current question: {self.current_question}
+Question {self.question_count + 1}: {self.current_question}
 Candidate response: {candidate_response[:500]}
-Evaluation score: {score}
-Areas to probe: {areas_to_probe}
-{context_summary}
-Job Requirements:
-{self.job_config['description'][:800]}
-Generate the next interview question appropriate for {self.job_config['level']} level.
+{evaluation_lines}Generate the next interview question appropriate for {self.job_config['level']} level.
 Return only the question text.
 """
+        emitted = False
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": question_prompt}],
+            stream = self._create_chained_response(
+                "_last_resp_id_question",
+                self._question_prefix,
+                question_prompt,
+                context=context_summary,
                 temperature=0.8,
-                max_tokens=250
+                max_output_tokens=250,
+                stream=True
             )
-            return response.choices[0].message['content'].strip()
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    emitted = True
+                    yield event.delta
+                elif event.type == "response.completed":
+                    self._pending_question_id = event.response.id
         except Exception:
-            fallback_questions = [
-                "Can you describe a challenging technical problem you've solved?",
-                "How do you stay updated in your field?",
-                "Tell me about a time you worked with a difficult team member.",
-                "What interests you about this role?",
-                "Do you have any questions about the position?"
-            ]
-            index = min(self.question_count, len(fallback_questions) - 1)
-            return fallback_questions[index]
+            pass
+        if emitted:
+            return
+
+        fallback_questions = [
+            "Can you describe a challenging technical problem you've solved?",
+            "How do you stay updated in your field?",
+            "Tell me about a time you worked with a difficult team member.",
+            "What interests you about this role?",
+            "Do you have any questions about the position?"
+        ]
+        index = min(self.question_count, len(fallback_questions) - 1)
+        yield fallback_questions[index]
 
     def get_interview_summary(self) -> Dict:
         """Return interview summary"""
         return {
-            "total_questions": len(self.interview_context),
+            "total_questions": self.question_count,
             "max_questions": self.max_questions,
-            "progress_percentage": min((len(self.interview_context) / self.max_questions) * 100, 100),
+            "progress_percentage": self._progress_percentage,
             "job_config": self.job_config,
-            "interview_context": self.interview_context
+            "interview_context": self.interview_context,
+            "earlier_summary": self._summary
         }
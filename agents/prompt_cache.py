@@ -0,0 +1,63 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", "prompt_cache.db")
+# Entries hold full candidate answers, so they expire rather than living forever
+CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 7 * 24 * 3600))
+
+# One connection per process, shared by the script and evaluation threads
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def _connection() -> sqlite3.Connection:
+    """Return the shared cache connection, creating the table on first use"""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, check_same_thread=False)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                "key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_cache_created ON prompt_cache(created_at)")
+        _conn = conn
+    return _conn
+
+
+def make_key(prompt: str, model: str, temperature: float) -> str:
+    """Build a cache key from everything that determines the completion"""
+    return hashlib.blake2b(f"{prompt}{model}{temperature}".encode()).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """Return the cached completion for key, or None on a miss or an expired entry"""
+    try:
+        with _lock:
+            row = _connection().execute(
+                "SELECT value FROM prompt_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - CACHE_TTL)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def put(key: str, value: str) -> None:
+    """Store a completion and drop expired entries; cache write failures are never fatal"""
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO prompt_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, now)
+                )
+                conn.execute("DELETE FROM prompt_cache WHERE created_at <= ?", (now - CACHE_TTL,))
+    except sqlite3.Error:
+        pass
@@ -1,17 +1,25 @@
 import streamlit as st
+import itertools
 import os
+import sqlite3
 from dotenv import load_dotenv
-import json
+import orjson
 from datetime import datetime
 
-# Import our custom modules
-from agents.interview_agent import InterviewAgent
+# Import our custom modules; the OpenAI-backed agent and report generator are
+# imported on first use so the welcome page doesn't pay for loading the SDK
 from utils.conversation_manager import ConversationManager
-from utils.report_generator import ReportGenerator
 
 # Load environment variables
 load_dotenv()
 
+# Maximum questions per interview duration setting
+_DURATION_MAP = {
+    "Quick (5-8 questions)": 8,
+    "Standard (8-12 questions)": 12,
+    "Comprehensive (12-15 questions)": 15
+}
+
 # Page configuration
 st.set_page_config(
     page_title="Smart Interview Agent",
@@ -61,6 +69,25 @@ def initialize_session_state():
         st.session_state.job_config = {}
     if "interview_ended" not in st.session_state:
         st.session_state.interview_ended = False
+    if st.session_state.conversation_manager is None and "session_id" in st.query_params:
+        restore_interview(st.query_params["session_id"])
+
+def restore_interview(session_id):
+    """Resume a persisted interview after a page refresh or server restart"""
+    from agents.interview_agent import InterviewAgent
+    
+    conversation_manager = ConversationManager.load(session_id)
+    if conversation_manager is None:
+        del st.query_params["session_id"]
+        return
+    st.session_state.conversation_manager = conversation_manager
+    st.session_state.job_config = conversation_manager.job_config
+    st.session_state.interview_agent = InterviewAgent.resume(
+        conversation_manager.job_config,
+        conversation_manager.first_question,
+        conversation_manager.get_history()
+    )
+    st.session_state.interview_started = True
 
 def main():
     initialize_session_state()
@@ -111,9 +138,17 @@ def main():
             placeholder="e.g., John Doe"
         )
         
+        live_evaluation = st.checkbox(
+            "Score answers live",
+            value=True,
+            help="Turn off to score all answers in a single request when the report is generated."
+        )
+        
         # Validation and Start Button
         if st.button("🚀 Start Interview", type="primary"):
             if job_title and job_description:
+                from agents.interview_agent import InterviewAgent
+                
                 st.session_state.interview_started = True
                 st.session_state.interview_ended = False
                 st.session_state.job_config = {
@@ -122,10 +157,16 @@ def main():
                     "type": interview_type,
                     "duration": interview_duration,
                     "description": job_description,
-                    "candidate_name": candidate_name or "Candidate"
+                    "candidate_name": candidate_name or "Candidate",
+                    "live_evaluation": live_evaluation
                 }
                 st.session_state.conversation_manager = ConversationManager()
                 st.session_state.interview_agent = InterviewAgent(st.session_state.job_config)
+                st.session_state.conversation_manager.start_session(
+                    st.session_state.job_config,
+                    st.session_state.interview_agent.get_first_question()
+                )
+                st.query_params["session_id"] = st.session_state.conversation_manager.session_id
                 st.success("✅ Interview initialized! Start the conversation below.")
                 st.rerun()
             else:
@@ -172,21 +213,11 @@ def show_welcome_page():
 def run_interview():
     """Main interview interface"""
     
-    # Interview Status Bar
-    col1, col2, col3, col4 = st.columns(4)
+    # Interview Status Bar; redrawn in place after a turn is processed without a rerun
+    status_bar = st.empty()
+    show_status_bar(status_bar)
     
     history = st.session_state.conversation_manager.get_history()
-    stats = st.session_state.conversation_manager.get_stats()
-    
-    with col1:
-        st.metric("Questions Asked", len(history))
-    with col2:
-        st.metric("Duration", stats.get("duration", "0 min"))
-    with col3:
-        st.metric("Average Score", f"{stats.get('average_score', 0):.1f}/10")
-    with col4:
-        progress = min(len(history) / 10, 1.0)  # Assume 10 questions max
-        st.metric("Progress", f"{int(progress * 100)}%")
     
     # Chat Interface
     st.markdown("### 💬 Interview Conversation")
@@ -204,26 +235,13 @@ def run_interview():
             # Display all exchanges
             for exchange in history:
                 with st.chat_message("human", avatar="👤"):
-                    st.write(f"**{st.session_state.job_config['candidate_name']}:** {exchange['candidate']}")
+                    st.write(f"**{st.session_state.job_config['candidate_name']}:** {exchange.candidate}")
                 
                 with st.chat_message("assistant", avatar="🤖"):
-                    st.write(f"**AI Interviewer:** {exchange['interviewer']}")
+                    st.write(f"**AI Interviewer:** {exchange.interviewer}")
                     
                     # Show evaluation if available
-                    if exchange.get('evaluation'):
-                        try:
-                            eval_data = json.loads(exchange['evaluation'])
-                            score = eval_data.get('score', 'N/A')
-                            feedback = eval_data.get('feedback', 'No feedback available')
-                            
-                            st.markdown(f"""
-                            <div style="background-color: #f0f8ff; padding: 8px; border-radius: 5px; margin: 5px 0; font-size: 0.9em;">
-                            <strong>Evaluation:</strong> Score: {score}/10<br>
-                            <strong>Feedback:</strong> {feedback}
-                            </div>
-                            """, unsafe_allow_html=True)
-                        except:
-                            pass
+                    show_evaluation(exchange.evaluation)
     
     # Input area
     st.markdown("### 🎤 Your Response")
@@ -237,55 +255,134 @@ def run_interview():
             st.rerun()
         return
     
-    # Response input
-    user_input = st.text_area(
-        "Type your response here:",
-        height=100,
-        placeholder="Share your thoughts, experience, or technical knowledge...",
-        key="user_response"
-    )
-    
-    col1, col2, col3 = st.columns([1, 1, 1])
+    col1, col2 = st.columns([1, 1])
     
     with col1:
-        if st.button("📤 Submit Response", type="primary") and user_input.strip():
-            process_candidate_response(user_input.strip())
-            st.rerun()
+        skip_requested = st.button("⏭️ Skip Question")
     
     with col2:
-        if st.button("⏭️ Skip Question"):
-            process_candidate_response("I'd prefer to skip this question.")
-            st.rerun()
-    
-    with col3:
         if st.button("🏁 End Interview"):
             st.session_state.interview_ended = True
             st.rerun()
+    
+    # Response input
+    prompt = st.chat_input("Share your thoughts, experience, or technical knowledge...")
+    if prompt and prompt.strip():
+        user_input = prompt.strip()
+    elif skip_requested:
+        user_input = "I'd prefer to skip this question."
+    else:
+        return
+    
+    # Append the new exchange below the history in this run instead of rerunning the whole script
+    with chat_container:
+        with st.chat_message("human", avatar="👤"):
+            st.write(f"**{st.session_state.job_config['candidate_name']}:** {user_input}")
+        process_candidate_response(user_input)
+    show_status_bar(status_bar)
+    
+    if len(st.session_state.conversation_manager.get_history()) >= max_questions:
+        st.rerun()
+
+def show_status_bar(placeholder):
+    """Render the interview metrics into the given placeholder"""
+    history = st.session_state.conversation_manager.get_history()
+    stats = st.session_state.conversation_manager.get_stats()
+    
+    with placeholder.container():
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Questions Asked", len(history))
+        with col2:
+            st.metric("Duration", stats.get("duration", "0 min"))
+        with col3:
+            st.metric("Average Score", f"{stats.get('average_score', 0):.1f}/10")
+        with col4:
+            progress = min(len(history) / 10, 1.0)  # Assume 10 questions max
+            st.metric("Progress", f"{int(progress * 100)}%")
+
+def show_evaluation(eval_data):
+    """Render the score and feedback box for an exchange"""
+    if eval_data:
+        st.markdown(f"""
+        <div style="background-color: #f0f8ff; padding: 8px; border-radius: 5px; margin: 5px 0; font-size: 0.9em;">
+        <strong>Evaluation:</strong> Score: {eval_data.get('score', 'N/A')}/10<br>
+        <strong>Feedback:</strong> {eval_data.get('feedback', 'No feedback available')}
+        </div>
+        """, unsafe_allow_html=True)
 
 def process_candidate_response(user_input):
     """Process candidate response and get next question"""
     try:
-        with st.spinner("🤔 AI is evaluating your response..."):
-            # Get response from interview agent
-            agent_response = st.session_state.interview_agent.process_response(user_input)
-            
+        agent = st.session_state.interview_agent
+        conversation_manager = st.session_state.conversation_manager
+
+        # Stream the next question while the response is evaluated in the background
+        with st.chat_message("assistant", avatar="🤖"):
+            # Lead with the same label the history uses so the bubble doesn't change on the next rerun
+            st.write_stream(itertools.chain(["**AI Interviewer:** "], agent.stream_response(user_input)))
+            agent_response = agent.last_turn
+
             # Add to conversation history
-            st.session_state.conversation_manager.add_exchange(user_input, agent_response)
+            conversation_manager.add_exchange(user_input, agent_response)
+            show_evaluation(conversation_manager.get_history()[-1].evaluation)
             
+    except sqlite3.Error as e:
+        # The answer wasn't saved; rewind the agent to the saved history so both stay in step
+        from agents.interview_agent import InterviewAgent
+        
+        st.session_state.interview_agent = InterviewAgent.resume(
+            conversation_manager.job_config,
+            conversation_manager.first_question,
+            conversation_manager.get_history()
+        )
+        st.error(f"Could not save your response: {str(e)}")
+        st.error("Please submit your answer again.")
     except Exception as e:
         st.error(f"Error processing response: {str(e)}")
         st.error("Please check your OpenAI API key and try again.")
 
+@st.cache_resource
+def get_report_generator():
+    """Share one ReportGenerator (and its OpenAI connection pool) across reruns and sessions"""
+    from utils.report_generator import ReportGenerator
+    
+    return ReportGenerator()
+
 def show_interview_report():
     """Display comprehensive interview report"""
     st.markdown("# 📊 Interview Report")
     
     # Generate report
     try:
-        with st.spinner("📝 Generating comprehensive interview report..."):
-            conversation_data = st.session_state.conversation_manager.export_conversation()
-            report_generator = ReportGenerator()
-            report = report_generator.generate_report(conversation_data, st.session_state.job_config)
+        conversation_manager = st.session_state.conversation_manager
+        if conversation_manager.has_pending_evaluations():
+            with st.spinner("🧮 Scoring all responses..."):
+                evaluations = st.session_state.interview_agent.evaluate_transcript(conversation_manager.get_qa_pairs())
+                conversation_manager.apply_evaluations(evaluations)
+        
+        report_generator = get_report_generator()
+        
+        # Reuse the report across reruns (e.g. export buttons) while the conversation is unchanged
+        report_key = (conversation_manager.session_id, len(conversation_manager.get_history()))
+        if st.session_state.get("report_key") == report_key:
+            report = st.session_state.report
+        else:
+            with st.spinner("📝 Generating comprehensive interview report..."):
+                conversation_data = conversation_manager.export_conversation()
+
+                # Show the report text as it streams in, then replace it with the formatted sections
+                placeholder = st.empty()
+                report = report_generator.generate_report(
+                    conversation_data,
+                    st.session_state.job_config,
+                    stream_callback=lambda text: placeholder.markdown(text)
+                )
+                placeholder.empty()
+            # A fallback report after an API error is not kept, so the next rerun tries again
+            if "error_note" not in report:
+                st.session_state.report = report
+                st.session_state.report_key = report_key
         
         # Display report sections
         col1, col2 = st.columns([2, 1])
@@ -334,7 +431,7 @@ def show_interview_report():
             if st.button("📊 Download JSON"):
                 st.download_button(
                     label="Download Report JSON",
-                    data=json.dumps(report, indent=2),
+                    data=orjson.dumps(report, option=orjson.OPT_INDENT_2).decode(),
                     file_name=f"interview_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                     mime="application/json"
                 )
@@ -350,22 +447,19 @@ def show_interview_report():
 
 def get_max_questions(duration_setting):
     """Get maximum questions based on duration setting"""
-    duration_map = {
-        "Quick (5-8 questions)": 8,
-        "Standard (8-12 questions)": 12,
-        "Comprehensive (12-15 questions)": 15
-    }
-    return duration_map.get(duration_setting, 10)
+    return _DURATION_MAP.get(duration_setting, 10)
 
 def reset_interview():
     """Reset all interview session state"""
     keys_to_reset = [
         "interview_started", "conversation_manager", "interview_agent", 
-        "job_config", "interview_ended"
+        "job_config", "interview_ended", "report", "report_key"
     ]
     for key in keys_to_reset:
         if key in st.session_state:
             del st.session_state[key]
+    if "session_id" in st.query_params:
+        del st.query_params["session_id"]
 
 if __name__ == "__main__":
     main()
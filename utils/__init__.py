@@ -5,8 +5,15 @@ This package contains utility classes for managing conversations,
 generating reports, and handling interview data.
 """
 
-from .conversation_manager import ConversationManager
-from .report_generator import ReportGenerator
+from .conversation_manager import ConversationManager, Exchange
 
-__all__ = ['ConversationManager', 'ReportGenerator']
+__all__ = ['ConversationManager', 'Exchange', 'ReportGenerator']
 __version__ = '1.0.0'
+
+
+def __getattr__(name):
+    # ReportGenerator pulls in the OpenAI SDK, so load it only when first requested
+    if name == 'ReportGenerator':
+        from .report_generator import ReportGenerator
+        return ReportGenerator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,65 +1,222 @@
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+import orjson
+
+DB_PATH = os.getenv("INTERVIEW_DB_PATH", "interviews.db")
+
+# The schema and WAL mode only need setting up once per process, not on every write
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the interview database, creating the tables on first use"""
+    global _schema_ready
+    conn = sqlite3.connect(DB_PATH, timeout=5)
+    if _schema_ready:
+        return conn
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions("
+            "session_id TEXT PRIMARY KEY, job_config TEXT, first_question TEXT, created_at TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges("
+            "session_id TEXT, ts TEXT, candidate TEXT, interviewer TEXT, evaluation TEXT, score REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_exchanges_session ON exchanges(session_id, ts)")
+    _schema_ready = True
+    return conn
+
+
+@dataclass(slots=True)
+class Exchange:
+    """A single candidate answer and the interviewer's follow-up"""
+    timestamp: str
+    candidate: str
+    interviewer: str
+    evaluation: Dict[str, Any]
+    question_number: int
+    score: float
+    # Truncated copies used by the report prompt
+    candidate_preview: str = ""
+    interviewer_preview: str = ""
+
 class ConversationManager:
-    def __init__(self):
+    def __init__(self, session_id: Optional[str] = None):
         """Initialize the conversation manager"""
+        self.session_id = session_id or uuid.uuid4().hex
+        self.job_config = {}
+        self.first_question = ""
         self.conversation_history = []
-        self.start_time = datetime.now()
-        self.evaluation_scores = []
-        self.candidate_responses = []
-        self.interviewer_questions = []
+        self._word_count = 0
+        self._reset_score_stats()
+        
+        # Formatted duration is refreshed at most once per second rather than on every rerun
+        self._start_monotonic = time.monotonic()
+        self._last_duration_compute = self._start_monotonic
+        self._last_duration_str = "0 sec"
+        self._last_duration_minutes = 0
+    
+    @classmethod
+    def load(cls, session_id: str) -> Optional["ConversationManager"]:
+        """Reload a persisted interview session, or return None if it doesn't exist"""
+        with closing(_connect()) as conn:
+            row = conn.execute(
+                "SELECT job_config, first_question, created_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            exchanges = conn.execute(
+                "SELECT ts, candidate, interviewer, evaluation FROM exchanges WHERE session_id = ? ORDER BY ts, rowid",
+                (session_id,)
+            ).fetchall()
+        
+        manager = cls(session_id)
+        manager.job_config = orjson.loads(row[0])
+        manager.first_question = row[1]
+        for ts, candidate, interviewer, evaluation in exchanges:
+            manager._append_exchange(candidate, interviewer, orjson.loads(evaluation or "{}"), ts)
+        
+        # Carry the elapsed time over so the duration counts from the original start
+        elapsed = (datetime.now() - datetime.fromisoformat(row[2])).total_seconds()
+        manager._start_monotonic -= max(elapsed, 0.0)
+        manager._last_duration_compute = manager._start_monotonic
+        return manager
+    
+    def start_session(self, job_config: Dict[str, Any], first_question: str):
+        """Persist the interview configuration and opening question for this session"""
+        self.job_config = job_config
+        self.first_question = first_question
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions(session_id, job_config, first_question, created_at) VALUES (?, ?, ?, ?)",
+                (self.session_id, orjson.dumps(job_config).decode(), first_question, datetime.now().isoformat())
+            )
     
     def add_exchange(self, candidate_input: str, interviewer_response: Dict[str, Any]):
         """Add a conversation exchange between candidate and interviewer"""
+        question = interviewer_response.get("question", "")
+        evaluation = interviewer_response.get("evaluation", {})
+        timestamp = datetime.now().isoformat()
+        
+        # Write the row first so a failed insert (sqlite3.Error) leaves the in-memory history unchanged
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO exchanges(session_id, ts, candidate, interviewer, evaluation, score) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.session_id, timestamp, candidate_input, question,
+                 orjson.dumps(evaluation).decode(), self._score(evaluation))
+            )
+        self._append_exchange(candidate_input, question, evaluation, timestamp)
+    
+    def _append_exchange(self, candidate_input: str, question: str, evaluation: Dict[str, Any], timestamp: str) -> Exchange:
+        """Add an exchange to the in-memory history and statistics"""
         
         # Create exchange record
-        exchange = {
-            "timestamp": datetime.now().isoformat(),
-            "candidate": candidate_input,
-            "interviewer": interviewer_response.get("question", ""),
-            "evaluation": interviewer_response.get("evaluation", "{}"),
-            "question_number": len(self.conversation_history) + 1,
-            "score": self._extract_score(interviewer_response.get("evaluation", "{}"))
-        }
+        exchange = Exchange(
+            timestamp=timestamp,
+            candidate=candidate_input,
+            interviewer=question,
+            evaluation=evaluation,
+            question_number=len(self.conversation_history) + 1,
+            score=self._score(evaluation),
+            candidate_preview=candidate_input[:300],
+            interviewer_preview=question[:200]
+        )
         
         # Add to history
         self.conversation_history.append(exchange)
         
-        # Update tracking lists
-        self.candidate_responses.append(candidate_input)
-        self.interviewer_questions.append(interviewer_response.get("question", ""))
-        
-        # Extract and store score
-        score = self._extract_score(interviewer_response.get("evaluation", "{}"))
-        if score is not None:
-            self.evaluation_scores.append(score)
-    
-    def _extract_score(self, evaluation_json: str) -> float:
-        """Extract numeric score from evaluation JSON"""
-        try:
-            eval_data = json.loads(evaluation_json)
-            score = eval_data.get("score", 0)
-            return float(score) if score is not None else 0.0
-        except (json.JSONDecodeError, ValueError, TypeError):
-            return 0.0
+        # Update running word count
+        self._word_count += len(candidate_input.split())
+        
+        # Store score; exchanges awaiting a batch evaluation have none yet
+        if evaluation:
+            self._record_score(exchange.score)
+        return exchange
+    
+    @staticmethod
+    def _score(evaluation: Dict[str, Any]) -> float:
+        """Numeric score of an evaluation, 0 while it is still pending"""
+        return float(evaluation.get("score") or 0.0)
+    
+    def has_pending_evaluations(self) -> bool:
+        """Check whether any exchange is still waiting for an evaluation"""
+        return any(not exchange.evaluation for exchange in self.conversation_history)
+    
+    def get_qa_pairs(self) -> List[Tuple[str, str]]:
+        """Return (question, answer) pairs; each answer responds to the previous exchange's question"""
+        questions = [self.first_question] + [exchange.interviewer for exchange in self.conversation_history[:-1]]
+        return [(question, exchange.candidate) for question, exchange in zip(questions, self.conversation_history)]
+    
+    def apply_evaluations(self, evaluations: List[Dict[str, Any]]):
+        """Fill in evaluations for every exchange at once and rebuild the score statistics"""
+        self._reset_score_stats()
+        with closing(_connect()) as conn, conn:
+            for exchange, evaluation in zip(self.conversation_history, evaluations):
+                exchange.evaluation = evaluation
+                exchange.score = self._score(evaluation)
+                if evaluation:
+                    self._record_score(exchange.score)
+                conn.execute(
+                    "UPDATE exchanges SET evaluation = ?, score = ? WHERE session_id = ? AND ts = ?",
+                    (orjson.dumps(evaluation).decode(), exchange.score, self.session_id, exchange.timestamp)
+                )
+    
+    def _reset_score_stats(self):
+        """Clear the score list and its running aggregates"""
+        self.evaluation_scores = []
+        
+        # Running score aggregates so stats don't rescan the score list on every rerun
+        self._score_sum = 0.0
+        self._score_min = float('inf')
+        self._score_max = 0.0
+        self._trend_split = 0
+        self._first_half_sum = 0.0
+        self._second_half_sum = 0.0
+    
+    def _record_score(self, score: float):
+        """Append a score and update the running aggregates"""
+        self.evaluation_scores.append(score)
+        self._score_sum += score
+        self._score_min = min(self._score_min, score)
+        self._score_max = max(self._score_max, score)
+        
+        # Keep the halves split at len // 2, moving scores across as the list grows
+        self._second_half_sum += score
+        while self._trend_split < len(self.evaluation_scores) // 2:
+            moved = self.evaluation_scores[self._trend_split]
+            self._first_half_sum += moved
+            self._second_half_sum -= moved
+            self._trend_split += 1
     
-    def get_history(self) -> List[Dict[str, Any]]:
-        """Get the complete conversation history"""
-        return self.conversation_history.copy()
+    def get_history(self) -> List[Exchange]:
+        """Get the complete conversation history; callers must treat it as read-only"""
+        return self.conversation_history
     
     def get_stats(self) -> Dict[str, Any]:
         """Get conversation statistics"""
-        duration = datetime.now() - self.start_time
+        now = time.monotonic()
+        if now - self._last_duration_compute > 1.0:
+            elapsed = now - self._start_monotonic
+            self._last_duration_str = self._format_duration(timedelta(seconds=elapsed))
+            self._last_duration_minutes = int(elapsed / 60)
+            self._last_duration_compute = now
         
         return {
             "total_exchanges": len(self.conversation_history),
-            "duration": self._format_duration(duration),
-            "duration_minutes": int(duration.total_seconds() / 60),
+            "duration": self._last_duration_str,
+            "duration_minutes": self._last_duration_minutes,
             "average_score": self.get_average_score(),
-            "highest_score": max(self.evaluation_scores) if self.evaluation_scores else 0,
-            "lowest_score": min(self.evaluation_scores) if self.evaluation_scores else 0,
+            "highest_score": self._score_max if self.evaluation_scores else 0,
+            "lowest_score": self._score_min if self.evaluation_scores else 0,
             "score_trend": self._calculate_score_trend()
         }
     
@@ -67,21 +224,21 @@ class ConversationManager:
         """Calculate average evaluation score"""
         if not self.evaluation_scores:
             return 0.0
-        return round(sum(self.evaluation_scores) / len(self.evaluation_scores), 1)
+        return round(self._score_sum / len(self.evaluation_scores), 1)
     
     def _calculate_score_trend(self) -> str:
         """Calculate if scores are trending up, down, or stable"""
         if len(self.evaluation_scores) < 2:
             return "stable"
         
-        first_half = self.evaluation_scores[:len(self.evaluation_scores)//2]
-        second_half = self.evaluation_scores[len(self.evaluation_scores)//2:]
+        first_count = self._trend_split
+        second_count = len(self.evaluation_scores) - first_count
         
-        if not first_half or not second_half:
+        if not first_count or not second_count:
             return "stable"
         
-        first_avg = sum(first_half) / len(first_half)
-        second_avg = sum(second_half) / len(second_half)
+        first_avg = self._first_half_sum / first_count
+        second_avg = self._second_half_sum / second_count
         
         if second_avg > first_avg + 0.5:
             return "improving"
@@ -116,8 +273,8 @@ class ConversationManager:
                 "highest_score": stats["highest_score"],
                 "lowest_score": stats["lowest_score"],
                 "score_trend": stats["score_trend"],
-                "total_candidate_words": sum(len(response.split()) for response in self.candidate_responses),
-                "average_response_length": sum(len(response.split()) for response in self.candidate_responses) // len(self.candidate_responses) if self.candidate_responses else 0
+                "total_candidate_words": self._word_count,
+                "average_response_length": self._word_count // len(self.conversation_history) if self.conversation_history else 0
             },
             "scores_timeline": self.evaluation_scores
         }
@@ -1,36 +1,62 @@
 import openai
-import json
+import orjson
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional
 
 class ReportGenerator:
+    MODEL = "gpt-4o-mini"
+    MAX_CACHED_REPORTS = 64
+    ASSESSMENT_FIELDS = ("overall_score", "technical_assessment", "soft_skills_assessment")
+    # Minimum seconds between stream_callback updates, so the buffer isn't rejoined and redrawn per token
+    STREAM_INTERVAL = 0.25
+
     def __init__(self):
         """Initialize the Report Generator"""
         self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+        # LRU of raw completions keyed by prompt hash; the instance is shared across reruns
+        self._response_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
     
-    def generate_report(self, conversation_data: Dict[str, Any], job_config: Dict[str, str]) -> Dict[str, Any]:
-        """Generate a comprehensive interview report"""
+    def generate_report(self, conversation_data: Dict[str, Any], job_config: Dict[str, str],
+                        stream_callback: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate a comprehensive interview report, passing partial output to stream_callback as it arrives"""
         
         try:
-            # Create analysis prompt
-            analysis_prompt = self._create_analysis_prompt(conversation_data, job_config)
+            # Create analysis prompts; both parts share the same interview context
+            analysis_context = self._create_analysis_prompt(conversation_data, job_config)
             
-            # Generate report content
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert technical interviewer and HR analyst. Provide thorough, fair, and professional interview evaluations."},
-                    {"role": "user", "content": analysis_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
+            # Generate both report parts concurrently. The summary is streamed from this
+            # thread because Streamlit elements can only be updated from the script thread.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                assessment_future = executor.submit(
+                    self._complete, self._prompt_assessment(analysis_context), None, 500
+                )
+                summary_content = self._complete(
+                    self._prompt_summary(analysis_context), stream_callback, 1000
+                )
+                assessment_content = assessment_future.result()
+            
+            # Parse the generated content, taking the score fields from the assessment part
+            summary = self._parse_report_content(summary_content)
+            assessment = self._parse_report_content(assessment_content)
+            parsed_report = summary if summary is not None else self._create_basic_report()
             
-            report_content = response.choices[0].message.content.strip()
+            # Score fields only ever come from a parsed assessment, never from the placeholder report
+            for field in self.ASSESSMENT_FIELDS:
+                parsed_report.pop(field, None)
+            if assessment is not None:
+                parsed_report.update({field: assessment[field] for field in self.ASSESSMENT_FIELDS if field in assessment})
             
-            # Parse the generated content
-            parsed_report = self._parse_report_content(report_content)
+            failed_parts = [name for name, part in (("summary", summary), ("assessment", assessment)) if part is None]
+            if failed_parts:
+                parsed_report["error_note"] = f"Fallback report due to: unreadable {' and '.join(failed_parts)} output"
             
             # Add metadata
             complete_report = self._add_metadata(parsed_report, conversation_data, job_config)
@@ -40,22 +66,70 @@ class ReportGenerator:
         except Exception as e:
             return self._create_fallback_report(conversation_data, job_config, str(e))
     
+    def _complete(self, prompt: str, stream_callback: Optional[Callable[[str], None]] = None,
+                  max_tokens: int = 1500) -> str:
+        """Run the report prompt, reusing the stored completion for an identical prompt"""
+        cache_key = hashlib.sha256(f"{self.MODEL}:{prompt}".encode()).hexdigest()
+        with self._cache_lock:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self._response_cache.move_to_end(cache_key)
+        if cached is not None:
+            if stream_callback:
+                stream_callback(cached)
+            return cached
+
+        response = self.client.chat.completions.create(
+            model=self.MODEL,
+            messages=[
+                {"role": "system", "content": "You are an expert technical interviewer and HR analyst. Provide thorough, fair, and professional interview evaluations. Return a JSON object."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+            stream=True
+        )
+
+        buf = []
+        last_update = time.monotonic()
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                buf.append(delta)
+                if stream_callback and time.monotonic() - last_update >= self.STREAM_INTERVAL:
+                    stream_callback("".join(buf))
+                    last_update = time.monotonic()
+        content = "".join(buf).strip()
+        if stream_callback:
+            stream_callback(content)
+
+        # Only keep complete JSON; output cut off by the token cap or an error is retried next time
+        try:
+            orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content
+        with self._cache_lock:
+            self._response_cache[cache_key] = content
+            if len(self._response_cache) > self.MAX_CACHED_REPORTS:
+                self._response_cache.popitem(last=False)
+        return content
+    
     def _create_analysis_prompt(self, conversation_data: Dict[str, Any], job_config: Dict[str, str]) -> str:
-        """Create the analysis prompt for report generation"""
+        """Create the interview context shared by both report prompts"""
         
         history = conversation_data.get("conversation_history", [])
         stats = conversation_data.get("statistics", {})
         
         # Build conversation summary
-        conversation_summary = ""
+        parts = []
         for i, exchange in enumerate(history, 1):
-            score = exchange.get("score", 0)
-            conversation_summary += f"""
-Question {i}: {exchange.get('interviewer', '')[:200]}
-Response: {exchange.get('candidate', '')[:300]}
-Score: {score}/10
-
-"""
+            parts.append(
+                f"Question {i}: {exchange.interviewer_preview}\n"
+                f"Response: {exchange.candidate_preview}\n"
+                f"Score: {exchange.score}/10\n"
+            )
+        conversation_summary = "\n".join(parts)
         
         return f"""Analyze this technical interview and provide a comprehensive evaluation report.
 
@@ -77,14 +151,30 @@ INTERVIEW STATISTICS:
 
 CONVERSATION DETAILS:
 {conversation_summary}
-
+"""
+    
+    def _prompt_summary(self, analysis_context: str) -> str:
+        """Create the prompt for the narrative half of the report"""
+        return f"""{analysis_context}
 Provide a structured analysis in JSON format with these exact fields:
 
 {{
   "executive_summary": "2-3 sentence overall assessment",
-  "overall_score": [number from 1-10],
   "strengths": ["List of 3-5 key strengths"],
   "areas_for_improvement": ["List of 3-4 improvement areas"],
+  "recommendation": "Choose: 'Strong Hire', 'Hire', 'No Hire', or 'Further Interview Required'",
+  "reasoning": "2-3 sentences explaining the recommendation"
+}}
+
+Return ONLY the JSON."""
+    
+    def _prompt_assessment(self, analysis_context: str) -> str:
+        """Create the prompt for the scoring half of the report"""
+        return f"""{analysis_context}
+Provide a structured scoring in JSON format with these exact fields:
+
+{{
+  "overall_score": [number from 1-10],
   "technical_assessment": {{
     "technical_knowledge": [1-10 score],
     "problem_solving": [1-10 score],
@@ -94,28 +184,19 @@ Provide a structured analysis in JSON format with these exact fields:
     "communication": [1-10 score],
     "adaptability": [1-10 score],
     "cultural_fit": [1-10 score]
-  }},
-  "recommendation": "Choose: 'Strong Hire', 'Hire', 'No Hire', or 'Further Interview Required'",
-  "reasoning": "2-3 sentences explaining the recommendation"
+  }}
 }}
 
 Return ONLY the JSON."""
     
-    def _parse_report_content(self, content: str) -> Dict[str, Any]:
-        """Parse the AI-generated report content"""
+    def _parse_report_content(self, content: str) -> Optional[Dict[str, Any]]:
+        """Parse the AI-generated report content, or return None if it isn't a JSON object"""
+        # JSON mode returns a bare object, so no brace scanning is needed
         try:
-            # Try to extract JSON from the response
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start != -1 and json_end != -1:
-                json_content = content[json_start:json_end]
-                return json.loads(json_content)
-            else:
-                return self._create_basic_report()
-                
-        except json.JSONDecodeError:
-            return self._create_basic_report()
+            parsed = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
     
     def _create_basic_report(self) -> Dict[str, Any]:
         """Create a basic report structure"""